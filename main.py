@@ -1,4 +1,7 @@
 import asyncio
+import concurrent.futures
+import fnmatch
+import functools
 import os
 from pathlib import Path
 from PIL import ImageFont
@@ -13,6 +16,7 @@ from .utils.image_utils import (
     _parse_text_to_render_units,
     _calculate_layout,
     _draw_image_content,
+    _split_lines_by_height,
     apply_effects,
 )
 
@@ -25,8 +29,34 @@ THEMES = {
 }
 
 
+@functools.lru_cache(maxsize=16)
+def _latest_matching_file(parent: str, pattern: str, parent_mtime_ns: int) -> str | None:
+    """单次 scandir 找出目录中 mtime 最新的匹配文件。
+
+    结果按 (目录, 模式, 目录 mtime) 缓存：目录一有增删，mtime 变化即
+    自然失效；在慢速文件系统（网络挂载、Docker 卷）上可免去重复扫描。
+    """
+    latest_path = None
+    latest_mtime = -1
+    with os.scandir(parent) as entries:
+        for entry in entries:
+            if not fnmatch.fnmatchcase(entry.name, pattern):
+                continue
+            mtime = entry.stat().st_mtime_ns
+            if mtime > latest_mtime:
+                latest_mtime = mtime
+                latest_path = entry.path
+    return latest_path
+
+
+@functools.lru_cache(maxsize=16)
+def _load_font(path: str, size: int):
+    """加载并缓存 TTF 字体对象，避免每次渲染都重新解析字体文件。"""
+    return ImageFont.truetype(path, size)
+
+
 # --- 核心文本转图片函数 ---
-def text_to_image(
+def text_to_images(
     text_content: str,
     output_path: Path,
     font_path: Path,
@@ -39,17 +69,20 @@ def text_to_image(
     width: int,
     text_line_spacing: int,
     divider_margin: int,
+    max_image_height: int = 4096,
     **kwargs,
-):
+) -> list[Path]:
     """
-    将给定的文本内容转换为图片。
+    将给定的文本内容转换为一张或多张图片。
 
     该函数处理文本解析、自动换行、Markdown粗体、分隔符、空行、
-    多种主题、圆角、边框和阴影效果。
+    多种主题、圆角、边框和阴影效果。整段文本只做一次解析和排版；
+    当内容高度超过 max_image_height 时，在行边界切分成多张图片，
+    文件名按 `_part_N` 派生。
 
     Args:
         text_content (str): 要渲染的原始文本。
-        output_path (Path): 输出图片的保存路径。
+        output_path (Path): 输出图片的保存路径（切分时作为命名模板）。
         font_path (Path): 常规字体的路径。
         font_path_bold (Path): 粗体字体的路径。
         font_size (int): 字体大小。
@@ -60,26 +93,23 @@ def text_to_image(
         width (int): 图片的总宽度。
         text_line_spacing (int): 文本行之间的额外间距。
         divider_margin (int): 分隔符上下的外边距。
+        max_image_height (int): 单张图片允许的最大高度（单位：px）。
+
+    Returns:
+        list[Path]: 实际保存的图片路径，按内容顺序排列。
     """
     # 1. 主题和字体设置
     selected_theme = THEMES.get(theme, THEMES["default"])
 
+    # 字体路径已在配置加载时校验过（不存在则为 None），此处不再做 stat
     try:
-        font_regular = (
-            ImageFont.truetype(str(font_path), font_size)
-            if font_path and Path(font_path).exists()
-            else ImageFont.load_default()
-        )
+        font_regular = _load_font(str(font_path), font_size) if font_path is not None else ImageFont.load_default()
     except (IOError, TypeError):
         logger.error(f"常规字体 '{font_path}' 加载失败，使用默认字体。")
         font_regular = ImageFont.load_default()
 
     try:
-        font_bold = (
-            ImageFont.truetype(str(font_path_bold), font_size)
-            if font_path_bold and Path(font_path_bold).exists()
-            else font_regular
-        )
+        font_bold = _load_font(str(font_path_bold), font_size) if font_path_bold is not None else font_regular
     except (IOError, TypeError):
         logger.error(f"粗体字体 '{font_path_bold}' 加载失败，退回使用常规字体。")
         font_bold = font_regular
@@ -89,24 +119,55 @@ def text_to_image(
     # 2. 文本解析
     render_units = _parse_text_to_render_units(text_content)
 
-    # 3. 计算布局
+    # 3. 计算布局（字符宽度缓存跨布局/绘制两个阶段复用）
+    width_cache = {"normal": {}, "bold": {}}
     max_content_width = width - (2 * padding)
     processed_lines, total_height = _calculate_layout(
-        render_units, max_content_width, fonts, text_line_spacing, divider_margin
+        render_units, max_content_width, fonts, text_line_spacing, divider_margin, width_cache
     )
-    img_height = total_height + (2 * padding)
 
-    # 4. 绘制图像
-    content_image = _draw_image_content(
-        processed_lines, width, img_height, padding, fonts, selected_theme, text_line_spacing, divider_margin
-    )
+    # 4. 按像素高度切分：真正的限制是图片高度而非字节数
+    max_content_height = max_image_height - (2 * padding)
+    if total_height > max_content_height:
+        slices = _split_lines_by_height(processed_lines, max_content_height, text_line_spacing, divider_margin)
+    else:
+        slices = [(processed_lines, total_height)]
+
+    # 5. 逐段绘制、应用效果并保存（圆角需要 alpha 时直接生成 RGBA 画布）
+    content_mode = "RGBA" if corner_radius > 0 else "RGB"
+    saved_paths = []
+    for index, (lines_slice, slice_height) in enumerate(slices):
+        img_height = slice_height + (2 * padding)
+        content_image = _draw_image_content(
+            lines_slice,
+            width,
+            img_height,
+            padding,
+            fonts,
+            selected_theme,
+            text_line_spacing,
+            divider_margin,
+            width_cache,
+            content_mode,
+        )
 
-    # 5. 应用最终效果并保存
-    final_image = apply_effects(content_image, use_frame, corner_radius)
-    if final_image.mode == "RGBA" and not output_path.suffix.lower() == ".png":
-        output_path = output_path.with_suffix(".png")
-    final_image.save(output_path)
-    logger.info(f"图片已成功保存到: {output_path.resolve()}")
+        final_image = apply_effects(content_image, use_frame, corner_radius)
+        if len(slices) == 1:
+            part_path = output_path
+        else:
+            part_path = output_path.with_name(f"{output_path.stem}_part_{index + 1}{output_path.suffix}")
+        if final_image.mode == "RGBA":
+            if not part_path.suffix.lower() == ".png":
+                part_path = part_path.with_suffix(".png")
+            # 图片即渲即发，低压缩级别换取更快的 PNG 编码（体积差异可忽略）
+            final_image.save(part_path, format="PNG", compress_level=1, optimize=False)
+        else:
+            # 无透明通道（无边框且直角）时走 JPEG：编码更快，渐变背景体积也更小
+            part_path = part_path.with_suffix(".jpg")
+            final_image.save(part_path, format="JPEG", quality=90)
+        logger.info(f"图片已成功保存到: {part_path.resolve()}")
+        saved_paths.append(part_path)
+    return saved_paths
 
 
 # --- AstrBot 插件主类 ---
@@ -123,12 +184,25 @@ class TextToImage(Star):
         self.config = config
         self._load_config()
         self._initialize_paths()
+        # 渲染是 CPU 密集型工作，使用独立进程池避免占用默认线程池并绕开 GIL
+        self._render_pool = concurrent.futures.ProcessPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+
+    @staticmethod
+    def _validate_font_path(path_str) -> Path | None:
+        """在配置加载时校验一次字体路径，避免每次渲染重复 stat。"""
+        if not path_str:
+            return None
+        path = Path(path_str)
+        if not path.exists():
+            logger.warning(f"字体文件 '{path_str}' 不存在，将使用默认字体。")
+            return None
+        return path
 
     def _load_config(self):
         """从 AstrBot 配置中加载并设置插件所需的参数。"""
         self.text_file_path_template = self.config.get("text_file_path")
-        self.font_path = self.config.get("font_path")
-        self.font_path_bold = self.config.get("font_path_bold")
+        self.font_path = self._validate_font_path(self.config.get("font_path"))
+        self.font_path_bold = self._validate_font_path(self.config.get("font_path_bold"))
         self.font_size = self.config.get("font_size", 24)
         self.theme = self.config.get("theme", "dark-gradient")
         self.width = self.config.get("width", 1080)
@@ -165,19 +239,23 @@ class TextToImage(Star):
         if not path_obj.is_absolute():
             path_obj = base_path / path_obj
 
-        # 处理通配符，查找最新文件
+        # 处理通配符，查找最新文件（结果按目录 mtime 缓存）
         if "*" in path_obj.name or "?" in path_obj.name:
             start_time = time.time()
-            file_list = list(path_obj.parent.glob(path_obj.name))
-            if not file_list:
+            try:
+                parent_mtime_ns = path_obj.parent.stat().st_mtime_ns
+            except OSError:
+                logger.warning(f"找不到匹配 '{path_obj}' 的文件。")
+                return None
+
+            latest_path = _latest_matching_file(str(path_obj.parent), path_obj.name, parent_mtime_ns)
+            if latest_path is None:
                 logger.warning(f"找不到匹配 '{path_obj}' 的文件。")
                 return None
 
-            latest_file = max(file_list, key=lambda p: p.stat().st_mtime)
+            latest_file = Path(latest_path)
             duration = time.time() - start_time
-            logger.info(
-                f"动态路径 '{path_template}' 在 {duration:.4f} 秒内解析为最新文件: {latest_file} (已检查 {len(file_list)} 个文件)"
-            )
+            logger.info(f"动态路径 '{path_template}' 在 {duration:.4f} 秒内解析为最新文件: {latest_file}")
             return latest_file
         else:
             return path_obj
@@ -192,7 +270,7 @@ class TextToImage(Star):
         """
         处理 'daily dev' 命令。
         从指定的文本文件生成日报图片并发送到频道。
-        如果文件大小超过10KB，则会裁剪成多张图片发送。
+        如果内容高度超过单张图片上限，则会在行边界切分成多张图片发送。
         """
         if not event.is_admin():
             yield event.plain_result("抱歉，只有管理员才能使用此命令。")
@@ -211,74 +289,34 @@ class TextToImage(Star):
             return
 
         try:
-            file_size = os.path.getsize(text_file)
-            content = text_file.read_text(encoding="utf-8")
+            content = text_file.read_bytes().decode("utf-8")
             loop = asyncio.get_running_loop()
-            MAX_CHUNK_SIZE = 10 * 1024  # 10KB
-
-            if file_size <= MAX_CHUNK_SIZE:
-                # 文件较小，直接生成单张图片
-                timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                output_filename = self.output_dir / f"daily_dev_{timestamp}.png"
-                await loop.run_in_executor(
-                    None,
-                    text_to_image,
-                    content,
-                    output_filename,
-                    self.font_path,
-                    self.font_path_bold,
-                    self.font_size,
-                    self.padding,
-                    self.theme,
-                    self.use_frame,
-                    self.corner_radius,
-                    self.width,
-                    self.text_line_spacing,
-                    self.divider_margin,
-                )
-                yield event.image_result(str(output_filename))
-            else:
-                # 文件较大，分块处理
-                lines = content.split("\n")
-                chunks = []
-                current_chunk_lines = []
-                current_chunk_size = 0
-
-                for line in lines:
-                    line_bytes = line.encode("utf-8")
-                    if current_chunk_size + len(line_bytes) + 1 > MAX_CHUNK_SIZE and current_chunk_lines:
-                        chunks.append("\n".join(current_chunk_lines))
-                        current_chunk_lines = [line]
-                        current_chunk_size = len(line_bytes)
-                    else:
-                        current_chunk_lines.append(line)
-                        current_chunk_size += len(line_bytes) + 1
-
-                if current_chunk_lines:
-                    chunks.append("\n".join(current_chunk_lines))
-
-                for i, chunk_content in enumerate(chunks):
-                    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                    output_filename = self.output_dir / f"daily_dev_{timestamp}_part_{i+1}.png"
-
-                    await loop.run_in_executor(
-                        None,
-                        text_to_image,
-                        chunk_content,
-                        output_filename,
-                        self.font_path,
-                        self.font_path_bold,
-                        self.font_size,
-                        self.padding,
-                        self.theme,
-                        self.use_frame,
-                        self.corner_radius,
-                        self.width,
-                        self.text_line_spacing,
-                        self.divider_margin,
-                    )
-                    yield event.image_result(str(output_filename))
+
+            # 整段文本一次解析排版，超过单图高度上限时按行切分，
+            # 渲染全部在工作进程内完成
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            output_filename = self.output_dir / f"daily_dev_{timestamp}.png"
+            saved_paths = await loop.run_in_executor(
+                self._render_pool,
+                text_to_images,
+                content,
+                output_filename,
+                self.font_path,
+                self.font_path_bold,
+                self.font_size,
+                self.padding,
+                self.theme,
+                self.use_frame,
+                self.corner_radius,
+                self.width,
+                self.text_line_spacing,
+                self.divider_margin,
+            )
+
+            for i, saved_path in enumerate(saved_paths):
+                if i > 0:
                     await asyncio.sleep(1)  # 防止发送过于频繁
+                yield event.image_result(str(saved_path))
 
         except Exception as e:
             logger.error(f"处理 'daily dev' 命令时发生未知错误: {e}", exc_info=True)
@@ -286,4 +324,5 @@ class TextToImage(Star):
 
     async def terminate(self):
         """插件终止时调用的清理函数。"""
+        self._render_pool.shutdown(wait=False, cancel_futures=True)
         logger.info("TextToImage 插件已终止。")
@@ -1,46 +1,80 @@
-import re
+import bisect
+import functools
+from itertools import accumulate
+
 import numpy as np
 from PIL import Image, ImageDraw, ImageFilter
 
-NO_START_CHARS = {
-    ",",
-    ".",
-    "!",
-    "?",
-    ";",
-    ":",
-    "}",
-    "]",
-    ")",
-    ">",
-    "》",
-    "】",
-    "』",
-    "，",
-    "。",
-    "！",
-    "？",
-    "；",
-    "：",
-    "”",
-    "’",
-    "）",
-    "』",
-    "】",
-    "〉",
-    "》",
-    "、",
-}
+# 禁止出现在行首的标点（避头尾规则），模块级 frozenset 供换行热循环查询
+NO_START_CHARS = frozenset(",.!?;:}])>》】』，。！？；：”’）〉、")
+
+# 同一集合的码点形式：整数哈希比单字符字符串哈希更快，供热循环成员测试
+_NO_START_ORDS = frozenset(map(ord, NO_START_CHARS))
+
+
+# 带阴影边框的固定参数
+_FRAME_PADDING = 20
+_SHADOW_OFFSET = 10
+_SHADOW_BLUR_RADIUS = 15
+_SHADOW_COLOR = (0, 0, 0, 50)
 
 
 # --- 图像效果函数 ---
-def create_gradient_image(width, height, color1, color2):
-    """创建一个从 color1 到 color2 的垂直渐变图像。"""
+def create_gradient_image(width, height, color1, color2, mode="RGB"):
+    """创建一个从 color1 到 color2 的垂直渐变图像，支持 RGB/RGBA 模式。"""
     c1 = np.array(color1, dtype=np.uint8)
     c2 = np.array(color2, dtype=np.uint8)
     gradient = np.linspace(c1, c2, height, dtype=np.uint8)
-    image_array = np.tile(gradient, (width, 1, 1)).transpose(1, 0, 2)
-    return Image.fromarray(image_array)
+    # 广播按行填充最终缓冲区，避免 tile+transpose 产生的中间拷贝
+    image_array = np.empty((height, width, len(mode)), dtype=np.uint8)
+    image_array[..., :3] = gradient[:, None, :]
+    if mode == "RGBA":
+        image_array[..., 3] = 255
+    return Image.fromarray(image_array, mode)
+
+
+@functools.lru_cache(maxsize=8)
+def _make_shadow(content_width, content_height, corner_radius):
+    """生成边框阴影并按 (内容尺寸, 圆角) 缓存。
+
+    同一会话里报告的宽度固定、高度也经常重复，模糊是效果阶段最贵的
+    操作，缓存命中时整段开销归零。paste 以阴影自身为蒙版，不会修改
+    缓存的图像。
+    """
+    canvas_size = (
+        content_width + 2 * _FRAME_PADDING + _SHADOW_OFFSET,
+        content_height + 2 * _FRAME_PADDING + _SHADOW_OFFSET,
+    )
+    # 阴影是低频信息：在 1/4 分辨率画布上绘制和模糊，再双线性放大，模糊开销降为 1/16
+    shadow_scale = 4
+    small_size = (max(1, canvas_size[0] // shadow_scale), max(1, canvas_size[1] // shadow_scale))
+    shadow_small = Image.new("RGBA", small_size, (0, 0, 0, 0))
+    shadow_draw = ImageDraw.Draw(shadow_small)
+    shadow_box = (
+        _FRAME_PADDING // shadow_scale,
+        _FRAME_PADDING // shadow_scale,
+        (_FRAME_PADDING + content_width) // shadow_scale,
+        (_FRAME_PADDING + content_height) // shadow_scale,
+    )
+    shadow_draw.rounded_rectangle(shadow_box, radius=corner_radius // shadow_scale, fill=_SHADOW_COLOR)
+    shadow_small = shadow_small.filter(ImageFilter.GaussianBlur(_SHADOW_BLUR_RADIUS / shadow_scale))
+    return shadow_small.resize(canvas_size, Image.BILINEAR)
+
+
+@functools.lru_cache(maxsize=16)
+def _rounded_mask(width, height, radius):
+    """用 numpy 向量化生成圆角矩形的 alpha 蒙版，带 1px 抗锯齿过渡。
+
+    同尺寸同圆角的蒙版逐像素相同，按 (w, h, r) 缓存；putalpha 只读取
+    蒙版内容，不会修改缓存的图像。
+    """
+    y, x = np.ogrid[:height, :width]
+    # 距离四个圆角圆心的水平/垂直偏移；矩形主体区域偏移为 0
+    dx = np.maximum(np.maximum(radius - x, x - (width - 1 - radius)), 0)
+    dy = np.maximum(np.maximum(radius - y, y - (height - 1 - radius)), 0)
+    dist = np.hypot(dx, dy)
+    mask = np.clip(radius + 0.5 - dist, 0, 1) * 255
+    return Image.fromarray(mask.astype(np.uint8), "L")
 
 
 def apply_effects(image: Image, use_frame: bool, corner_radius: int):
@@ -48,37 +82,28 @@ def apply_effects(image: Image, use_frame: bool, corner_radius: int):
     if not use_frame and corner_radius == 0:
         return image
 
-    image = image.convert("RGBA")
-    # 应用圆角
+    # 应用圆角（画布通常已按 RGBA 创建，此处转换只是兜底）
     if corner_radius > 0:
-        mask = Image.new("L", image.size, 0)
-        mask_draw = ImageDraw.Draw(mask)
-        mask_draw.rounded_rectangle((0, 0, image.width, image.height), radius=corner_radius, fill=255)
-        image.putalpha(mask)
+        if image.mode != "RGBA":
+            image = image.convert("RGBA")
+        image.putalpha(_rounded_mask(image.width, image.height, corner_radius))
 
     if not use_frame:
         return image
 
     # 应用带阴影的边框
-    frame_padding = 20
-    shadow_offset = 10
-    blur_radius = 15
-    shadow_color = (0, 0, 0, 50)
-
     frame_with_shadow = Image.new(
         "RGBA",
-        (image.width + 2 * frame_padding + shadow_offset, image.height + 2 * frame_padding + shadow_offset),
+        (image.width + 2 * _FRAME_PADDING + _SHADOW_OFFSET, image.height + 2 * _FRAME_PADDING + _SHADOW_OFFSET),
         (0, 0, 0, 0),
     )
 
-    shadow = Image.new("RGBA", frame_with_shadow.size, (0, 0, 0, 0))
-    shadow_draw = ImageDraw.Draw(shadow)
-    shadow_box = (frame_padding, frame_padding, frame_padding + image.width, frame_padding + image.height)
-    shadow_draw.rounded_rectangle(shadow_box, radius=corner_radius, fill=shadow_color)
-    shadow = shadow.filter(ImageFilter.GaussianBlur(blur_radius))
-
-    frame_with_shadow.paste(shadow, (shadow_offset, shadow_offset), shadow)
-    frame_with_shadow.paste(image, (frame_padding, frame_padding), image)
+    shadow = _make_shadow(image.width, image.height, corner_radius)
+    frame_with_shadow.paste(shadow, (_SHADOW_OFFSET, _SHADOW_OFFSET), shadow)
+    if image.mode == "RGBA":
+        frame_with_shadow.paste(image, (_FRAME_PADDING, _FRAME_PADDING), image)
+    else:
+        frame_with_shadow.paste(image, (_FRAME_PADDING, _FRAME_PADDING))
 
     return frame_with_shadow
 
@@ -87,14 +112,32 @@ def _parse_text_to_render_units(text_content: str):
     """将原始文本解析成一个渲染单元的结构化列表。"""
 
     def parse_line_to_runs(line_text):
+        # 单遍 str.find 扫描代替正则切分；相邻同样式的片段直接合并，
+        # 后续阶段可假定样式交替出现
         runs = []
-        parts = re.split(r"(\*\*.*?\*\*)", line_text)
-        for part in parts:
-            if part.startswith("**") and part.endswith("**"):
-                runs.append({"text": part[2:-2], "style": "bold"})
-            elif part:
-                runs.append({"text": part, "style": "normal"})
-        return [r for r in runs if r["text"]]
+
+        def append_run(text, style):
+            if not text:
+                return
+            if runs and runs[-1]["style"] == style:
+                runs[-1]["text"] += text
+            else:
+                runs.append({"text": text, "style": style})
+
+        pos = 0
+        while True:
+            open_idx = line_text.find("**", pos)
+            if open_idx < 0:
+                append_run(line_text[pos:], "normal")
+                break
+            close_idx = line_text.find("**", open_idx + 2)
+            if close_idx < 0:
+                append_run(line_text[pos:], "normal")
+                break
+            append_run(line_text[pos:open_idx], "normal")
+            append_run(line_text[open_idx + 2 : close_idx], "bold")
+            pos = close_idx + 2
+        return runs
 
     render_units = []
     original_lines = text_content.split("\n")
@@ -110,50 +153,73 @@ def _parse_text_to_render_units(text_content: str):
     return render_units
 
 
-def _calculate_layout(render_units, max_width, fonts, text_line_spacing, divider_margin):
-    """计算换行和每个元素的位置，并返回最终的图像尺寸。"""
+def _calculate_layout(render_units, max_width, fonts, text_line_spacing, divider_margin, width_cache=None):
+    """计算换行和每个元素的位置，并返回最终的图像尺寸。
+
+    width_cache 是一个 {"normal": {}, "bold": {}} 结构的字符宽度缓存，
+    避免对重复出现的字符反复调用 FreeType 测量。
 
-    def get_run_width(run):
-        return fonts[run["style"]].getbbox(run["text"])[2]
+    返回 (kind, line, line_height) 元组列表和内容总高度：行的类型在此
+    一次性判定（"text" / "divider" / "empty"），行高在换行的同时累加
+    完成，绘制阶段直接复用而不再逐行做类型判断或重新测量。
+    """
+    if width_cache is None:
+        width_cache = {style: {} for style in fonts}
+
+    # 行高对给定字体和字号是常量 (ascent + descent)，无需逐行测量
+    line_heights = {style: sum(font.getmetrics()) for style, font in fonts.items()}
+
+    def get_line_height(line_runs):
+        return max(line_heights[run.get("style", "normal")] for run in line_runs)
 
     processed_lines = []
+    total_height = 0
+
+    def append_line(line):
+        # 行间距在每个非首行之前计入；分隔符紧跟非空行时不计入，
+        # 与绘制阶段的 current_y 回退逻辑保持一致。
+        nonlocal total_height
+        kind = line[0]["type"] if line and "type" in line[0] else "text"
+        if kind == "divider":
+            line_height = line_heights["normal"]
+            if processed_lines and processed_lines[-1][0] == "empty":
+                total_height += text_line_spacing
+            total_height += line_height + (2 * divider_margin)
+        else:
+            line_height = line_heights["normal"] if kind == "empty" else get_line_height(line)
+            if processed_lines:
+                total_height += text_line_spacing
+            total_height += line_height
+        processed_lines.append((kind, line, line_height))
+
     for runs in render_units:
         if "type" in runs[0]:
-            processed_lines.append(runs)
+            append_line(runs)
             continue
 
         lines = []
         current_line = []
         current_width = 0
 
-        merged_runs = []
-        if runs:
-            merged_runs.append(runs[0])
-            for i in range(1, len(runs)):
-                if runs[i]["style"] == merged_runs[-1]["style"]:
-                    merged_runs[-1]["text"] += runs[i]["text"]
-                else:
-                    merged_runs.append(runs[i])
-
-        for run in merged_runs:
+        # parse_line_to_runs 已保证相邻 run 样式交替，无需再合并
+        for run in runs:
             font = fonts[run["style"]]
+            cache = width_cache[run["style"]]
             text = run["text"]
+            # 每个 run 只测量一次：从字符宽度缓存构造累计宽度表，
+            # 断行位置由二分查找得出，不再逐前缀调用测量函数
+            cum_widths = list(accumulate(cache.setdefault(c, font.getlength(c)) for c in text))
             start = 0
             while start < len(text):
-                # Find the maximum number of characters that fit on the current line
-                end = start
-                slice_width = 0
-                while end < len(text):
-                    char_width = font.getbbox(text[end])[2]
-                    # Break if char doesn't fit, but always include at least one char
-                    if current_width + slice_width + char_width > max_width and end > start:
-                        break
-                    slice_width += char_width
-                    end += 1
+                base_width = cum_widths[start - 1] if start else 0
+                end = bisect.bisect_right(cum_widths, base_width + max_width - current_width, lo=start)
+                # Always include at least one char, matching the old greedy loop
+                if end == start:
+                    end = start + 1
 
                 # If the character that would start the new line is a forbidden character,
                 # wrap one character earlier to keep it with the previous text.
-                if end < len(text) and text[end] in NO_START_CHARS:
+                if end < len(text) and ord(text[end]) in _NO_START_ORDS:
                     if end > start:
                         end -= 1
 
@@ -164,7 +230,7 @@ def _calculate_layout(render_units, max_width, fonts, text_line_spacing, divider
                         current_line[-1]["text"] += chunk
                     else:
                         current_line.append({"text": chunk, "style": run["style"]})
-                    current_width += font.getbbox(chunk)[2]
+                    current_width += cum_widths[end - 1] - base_width
 
                 # If the run was broken, finalize the current line and start a new one
                 if end < len(text):
@@ -174,98 +240,112 @@ def _calculate_layout(render_units, max_width, fonts, text_line_spacing, divider
                 start = end
         if current_line:
             lines.append(current_line)
-        processed_lines.extend(lines)
+        for line in lines:
+            append_line(line)
 
-    def get_line_height(line_runs):
-        max_h = 0
-        for run in line_runs:
-            font = fonts[run.get("style", "normal")]
-            bbox = font.getbbox(run["text"])
-            h = bbox[3] - bbox[1]
-            if h > max_h:
-                max_h = h
-        return max_h
-
-    def is_divider(line):
-        return line and "type" in line[0] and line[0]["type"] == "divider"
+    return processed_lines, total_height
 
-    def is_empty_line(line):
-        return line and "type" in line[0] and line[0]["type"] == "empty"
 
-    total_height = 0
-    for i, line in enumerate(processed_lines):
-        is_last_line = i == len(processed_lines) - 1
-
-        if is_divider(line):
-            if i > 0 and not is_empty_line(processed_lines[i - 1]):
-                total_height -= text_line_spacing
-            total_height += get_line_height([{"text": "─", "style": "normal"}]) + (2 * divider_margin)
-        elif is_empty_line(line):
-            total_height += get_line_height([{"text": " ", "style": "normal"}])
-        else:
-            total_height += get_line_height(line)
+def _split_lines_by_height(processed_lines, max_height, text_line_spacing, divider_margin):
+    """把已排版的行按累计像素高度切成多段，返回 (行列表, 段内容高度) 列表。
 
-        if not is_last_line:
-            total_height += text_line_spacing
-    return processed_lines, total_height
+    在行边界切分，避免了按字节数估算每张图容量的误差，也不会把
+    **粗体** 标记截断在两张图之间。高度计入方式与 _calculate_layout
+    的 append_line 保持一致。
+    """
+    slices = []
+    current = []
+    current_height = 0
 
-
-def _draw_image_content(processed_lines, width, height, padding, fonts, theme, text_line_spacing, divider_margin):
-    """在图像上进行实际的绘制操作。"""
+    for kind, line, line_height in processed_lines:
+        if kind == "divider":
+            extra = line_height + (2 * divider_margin)
+            if current and current[-1][0] == "empty":
+                extra += text_line_spacing
+        else:
+            extra = line_height + (text_line_spacing if current else 0)
+
+        if current and current_height + extra > max_height:
+            slices.append((current, current_height))
+            current = []
+            current_height = 0
+            extra = line_height + (2 * divider_margin) if kind == "divider" else line_height
+        current.append((kind, line, line_height))
+        current_height += extra
+
+    if current:
+        slices.append((current, current_height))
+    return slices
+
+
+def _draw_image_content(
+    processed_lines,
+    width,
+    height,
+    padding,
+    fonts,
+    theme,
+    text_line_spacing,
+    divider_margin,
+    width_cache=None,
+    mode="RGB",
+):
+    """在图像上进行实际的绘制操作。width_cache 复用布局阶段的字符宽度缓存。
+
+    mode 为 "RGBA" 时直接生成带 alpha 的画布，省去后续效果阶段的转换拷贝。
+    """
+    if width_cache is None:
+        width_cache = {style: {} for style in fonts}
     selected_theme = theme
     background_config = selected_theme["bg"]
     text_color = selected_theme["text"]
     is_gradient = isinstance(background_config, tuple) and isinstance(background_config[0], tuple)
 
     if is_gradient:
-        content_image = create_gradient_image(int(width), int(height), background_config[0], background_config[1])
+        content_image = create_gradient_image(int(width), int(height), background_config[0], background_config[1], mode)
     else:
-        content_image = Image.new("RGB", (int(width), int(height)), background_config)
+        bg_color = tuple(background_config) + (255,) if mode == "RGBA" else background_config
+        content_image = Image.new(mode, (int(width), int(height)), bg_color)
     draw = ImageDraw.Draw(content_image)
 
-    def get_line_height(line_runs):
-        max_h = 0
-        for run in line_runs:
-            font = fonts[run.get("style", "normal")]
-            bbox = font.getbbox(run["text"])
-            h = bbox[3] - bbox[1]
-            if h > max_h:
-                max_h = h
-        return max_h
-
-    def is_divider(line):
-        return line and "type" in line[0] and line[0]["type"] == "divider"
-
-    def is_empty_line(line):
-        return line and "type" in line[0] and line[0]["type"] == "empty"
-
-    divider_char = "─"
-    char_width = fonts["normal"].getbbox(divider_char)[2]
-    divider_line_text = divider_char * int((width - 2 * padding) / char_width) if char_width > 0 else ""
+    # 分隔线直接用 draw.line 画一条横线，免去逐字形渲染数百个 "─"
+    divider_line_width = max(1, getattr(fonts["normal"], "size", 16) // 16)
 
+    # 第一遍：按布局阶段标好的类型推进 y 坐标（纯整数运算），
+    # 把文本行和分隔线分别归集，绘制时无需再做逐行类型判断
+    text_items = []
+    divider_ys = []
     current_y = padding
-    for i, line in enumerate(processed_lines):
-        is_last_line = i == len(processed_lines) - 1
-
-        if is_divider(line):
-            line_height = get_line_height([{"text": "─", "style": "normal"}])
-            if i > 0 and not is_empty_line(processed_lines[i - 1]):
+    for i, (kind, line, line_height) in enumerate(processed_lines):
+        if kind == "divider":
+            if i > 0 and processed_lines[i - 1][0] != "empty":
                 current_y -= text_line_spacing
             current_y += divider_margin
-            draw.text((padding, current_y), divider_line_text, font=fonts["normal"], fill=text_color)
+            divider_ys.append(current_y + line_height // 2)
             current_y += line_height + divider_margin
-        elif is_empty_line(line):
-            line_height = get_line_height([{"text": " ", "style": "normal"}])
+        elif kind == "empty":
             current_y += line_height
         else:
-            line_height = get_line_height(line)
-            current_x = padding
-            for run in line:
-                font = fonts[run["style"]]
-                draw.text((current_x, current_y), run["text"], font=font, fill=text_color)
-                current_x += fonts[run["style"]].getbbox(run["text"])[2]
+            text_items.append((current_y, line))
             current_y += line_height
 
-        if not is_last_line:
+        if i != len(processed_lines) - 1:
             current_y += text_line_spacing
+
+    # 第二遍：分批绘制
+    for line_y in divider_ys:
+        draw.line([(padding, line_y), (width - padding, line_y)], fill=text_color, width=divider_line_width)
+
+    for line_y, line in text_items:
+        if len(line) == 1:
+            # 单一样式的整行一次性绘制（最常见情况）
+            run = line[0]
+            draw.text((padding, line_y), run["text"], font=fonts[run["style"]], fill=text_color)
+        else:
+            current_x = padding
+            for run in line:
+                font = fonts[run["style"]]
+                cache = width_cache[run["style"]]
+                draw.text((current_x, line_y), run["text"], font=font, fill=text_color)
+                current_x += sum(cache.setdefault(c, font.getlength(c)) for c in run["text"])
     return content_image